@@ -2,45 +2,158 @@
 """CLI helper: import M3U URL into DB and run a single check pass, printing results.
 
 This script starts an HTTP server (serving the repo directory) so the
-results HTML can fetch results.json via HTTP. The HTTP server runs in the
-main thread and persists after tests finish. Tests run in a background
-thread using asyncio.
+results HTML can fetch results.json via HTTP. The server (aiohttp) and the
+tests share one asyncio event loop, and the server persists after tests
+finish.
 """
 
 import sys
+import hashlib
 import json
+import mmap
 import os
+import re
 import time
-import threading
 import webbrowser
 import asyncio
+import orjson
 import tkinter as tk
 from tkinter import ttk
 
 from src.iptv_monitor.config import ensure_dirs
-from src.iptv_monitor.worker import fetch_text, parse_m3u, check_ts
-from src.iptv_monitor.db import init_db, add_channels_bulk, list_channels
+from src.iptv_monitor.worker import fetch_text, parse_m3u, check_ts, close_session
+from src.iptv_monitor.db import init_db, close_db, add_channels_bulk, list_channels
 
 RESULTS_PATH = 'results.json'
+RESULTS_PATCH_PATH = 'results.patch.jsonl'
+RESULTS_WRITE_INTERVAL = 1.0  # seconds between coalesced results.json snapshots
+RESULTS_WRITE_BUFFER = 1 << 20
+PROGRESS_INTERVAL = 1  # seconds between tested_seconds updates for running channels
+MAX_CONCURRENCY = 8  # channels probed at once; 1 restores strictly sequential testing
 HTTP_PORT = 9001
+SEARCH_DEBOUNCE_MS = 150  # selector search re-filters once typing pauses this long
 
-async def run_checks_async(channels, duration_seconds=60, check_interval=1, continuous_mode=False, loop_mode='single', current_iteration=0, channels_json=None):
+# ffmpeg stderr is scanned as raw bytes; lines are only decoded for notes
+_ERROR_RE = re.compile(rb'error|failed', re.IGNORECASE)
+_BUFFER_RE = re.compile(rb'buffer', re.IGNORECASE)
+READ_CHUNK_SIZE = 65536
+
+# '#EXTINF...,NAME' followed by the next non-empty, non-comment line (the URL)
+_EXTINF_RE = re.compile(rb'^#EXTINF[^\n]*?(?:,([^\n]*))?\n(?:[ \t\r]*\n|#[^\n]*\n)*[ \t]*([^#\s][^\n]*)', re.MULTILINE)
+
+
+async def _iter_lines(stream):
+    """Yield lines from an asyncio StreamReader using large chunk reads.
+
+    One read() per 64 KB instead of one readline() per line keeps the number
+    of scheduler hops low when ffmpeg is chatty.
+    """
+    buf = b''
+    while True:
+        chunk = await stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buf += chunk
+        *lines, buf = buf.split(b'\n')
+        for line in lines:
+            yield line
+    if buf:
+        yield buf
+
+# Digest of the last imported playlist + selection and the channels it produced
+_LAST_M3U = {'digest': None, 'channels': None}
+
+# Latest encoded results snapshot, served by the HTTP server without disk I/O
+# (None until the first write, which the dashboard sees as "no results yet")
+LATEST = {'bytes': None}
+
+
+def _write_results(state):
+    """Atomically publish state to RESULTS_PATH.
+
+    The JSON is encoded once (orjson emits compact bytes directly) and
+    written to a temp file which is then renamed over results.json, so the
+    HTTP poller never sees a torn file.
+    """
+    data = orjson.dumps(state)
+    LATEST['bytes'] = data
+    tmp_path = RESULTS_PATH + '.tmp'
+    # Binary mode with a 1 MiB buffer: no text encoding layer, the snapshot
+    # lands in a single write() and short writes are retried for us
+    with open(tmp_path, 'wb', buffering=RESULTS_WRITE_BUFFER) as f:
+        f.write(data)
+    os.replace(tmp_path, RESULTS_PATH)
+
+async def run_checks_async(channels, duration_seconds=60, check_interval=1, continuous_mode=False, loop_mode='single', current_iteration=0, channels_json=None, max_concurrency=MAX_CONCURRENCY):
     """Run repeated checks for all channels concurrently for duration_seconds.
 
     Each channel runs in its own coroutine and updates the shared results JSON.
+    At most max_concurrency channels are probed at the same time.
     If channels_json is provided, use it (preserving previous state); otherwise create new.
     """
-    results = []
     if channels_json is None:
         channels_json = [
             {'name': c[1], 'status': 'pending', 'details': '', 'url': c[2], 'resolution': '', 'test_duration': '', 'tested_seconds': 0, 'issues': {'buffering': 0, 'errors': 0}, 'disconnects_count': 0, 'disconnects': [], 'buffering_total_seconds': 0.0, 'buffering_events': []} for c in channels
         ]
     test_start = int(time.time())
+    state = {'channels': channels_json, 'test_start': test_start, 'test_duration': duration_seconds, 'loop_mode': loop_mode, 'current_iteration': current_iteration, 'patch_seq': 0}
+    patch_seq = 0
+
+    def write_state():
+        # patch_seq tells readers which patch lines the snapshot already includes
+        state['patch_seq'] = patch_seq
+        _write_results(state)
+
     # Write initial state with timestamp and duration, plus loop info
-    with open(RESULTS_PATH, 'w', encoding='utf-8') as f:
-        json.dump({'channels': channels_json, 'test_start': test_start, 'test_duration': duration_seconds, 'loop_mode': loop_mode, 'current_iteration': current_iteration}, f)
+    write_state()
+
+    # Probes only flag the state as dirty; a single writer task coalesces
+    # updates and rewrites results.json at most every RESULTS_WRITE_INTERVAL.
+    dirty = asyncio.Event()
+
+    def mark_dirty():
+        dirty.set()
+
+    # Every change is also appended to results.patch.jsonl as one line, so
+    # incremental readers get per-field updates between full snapshots.
+    # Growing lists (buffering_events, disconnects) are patched as
+    # {'append': {field: new_item}}; the full lists only go in the snapshot.
+    patch_fd = os.open(RESULTS_PATCH_PATH, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+
+    def emit_patch(idx, fields, appends=None):
+        nonlocal patch_seq
+        entry = channels_json[idx]
+        entry.update(fields)
+        patch_seq += 1
+        patch = {'seq': patch_seq, 'idx': idx, 'fields': fields}
+        if appends:
+            for key, item in appends.items():
+                entry[key].append(item)
+            patch['append'] = appends
+        os.write(patch_fd, orjson.dumps(patch) + b'\n')
+        mark_dirty()
+
+    async def results_writer():
+        while True:
+            await dirty.wait()
+            await asyncio.sleep(RESULTS_WRITE_INTERVAL)
+            dirty.clear()
+            write_state()
 
-    lock = asyncio.Lock()
+    writer_task = asyncio.create_task(results_writer())
+
+    # Continuous-mode probes register their live progress here while ffmpeg
+    # runs; one shared ticker publishes it instead of a timer per channel
+    running = {}
+
+    async def progress_ticker():
+        while True:
+            await asyncio.sleep(PROGRESS_INTERVAL)
+            now = time.time()
+            for idx, live in running.items():
+                emit_patch(idx, {'tested_seconds': int(now - live['start']), 'resolution': live['resolution'], 'details': live['details']})
+
+    ticker_task = asyncio.create_task(progress_ticker())
 
     async def probe_channel(idx, c):
         cid, name, url = c
@@ -50,10 +163,7 @@ async def run_checks_async(channels, duration_seconds=60, check_interval=1, cont
         last_notes = ''
         last_resolution = ''
         # mark running
-        async with lock:
-            channels_json[idx]['status'] = 'testing'
-            with open(RESULTS_PATH, 'w', encoding='utf-8') as f:
-                json.dump({'channels': channels_json, 'test_start': test_start, 'test_duration': duration_seconds, 'loop_mode': loop_mode, 'current_iteration': current_iteration}, f)
+        emit_patch(idx, {'status': 'testing'})
 
         if continuous_mode:
             # initial synchronous probe to capture resolution/notes immediately
@@ -65,71 +175,38 @@ async def run_checks_async(channels, duration_seconds=60, check_interval=1, cont
             except Exception:
                 last_notes = ''
                 last_resolution = ''
-            # Run ffprobe for the entire duration and read stdout/stderr for errors/buffering
+            # Pull the stream through ffmpeg for the entire duration, discarding the
+            # output; resolution comes from the initial probe above, so stderr only
+            # carries real errors/buffering messages. Stream copy skips decoding
+            # (network/demux errors still show up), and -nostdin keeps ffmpeg off
+            # the terminal, which a killed ffmpeg would otherwise leave without echo.
             proc = await asyncio.create_subprocess_exec(
-                'ffprobe', '-v', 'error', '-show_streams', '-show_format', '-i', url,
-                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                'ffmpeg', '-nostdin', '-hide_banner', '-nostats', '-loglevel', 'error',
+                '-i', url, '-t', str(duration_seconds), '-c', 'copy', '-f', 'null', '-',
+                stdin=asyncio.subprocess.DEVNULL, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE
             )
             stderr = proc.stderr
-            stdout = proc.stdout
-            async def read_stdout():
-                nonlocal last_resolution
-                last_width = None
-                last_height = None
-                while True:
-                    line = await stdout.readline()
-                    if not line:
-                        break
-                    text = line.decode('utf-8', errors='ignore').strip()
-                    # parse width/height lines
-                    if 'width=' in text:
-                        import re
-                        m = re.search(r'width=(\d+)', text)
-                        if m:
-                            last_width = m.group(1)
-                    if 'height=' in text:
-                        import re
-                        n = re.search(r'height=(\d+)', text)
-                        if n:
-                            last_height = n.group(1)
-                    if last_width and last_height:
-                        last_resolution = f"{last_width}x{last_height}"
+            live = {'start': start, 'resolution': last_resolution, 'details': last_notes}
+            running[idx] = live
             async def read_stderr():
                 nonlocal buffer_count, error_count, last_notes
-                while True:
-                    line = await stderr.readline()
-                    if not line:
-                        break
+                async for line in _iter_lines(stderr):
+                    is_error = _ERROR_RE.search(line) is not None
+                    is_buffer = _BUFFER_RE.search(line) is not None
+                    if not (is_error or is_buffer):
+                        continue
+                    # only decode lines that end up in the notes
                     text = line.decode('utf-8', errors='ignore').strip()
-                    if 'error' in text.lower() or 'failed' in text.lower():
+                    if is_error:
                         error_count += 1
                         last_notes = (last_notes + ' ' + text).strip()
-                    if 'buffer' in text.lower():
+                    if is_buffer:
                         buffer_count += 1
                         last_notes = (last_notes + ' ' + text).strip()
-            # start reading stdout and stderr
-            reader_out = asyncio.create_task(read_stdout())
+                    live['details'] = last_notes
+            # start reading stderr
             reader_err = asyncio.create_task(read_stderr())
 
-            # progress updater - write tested_seconds periodically while ffprobe runs
-            async def update_progress():
-                while True:
-                    try:
-                        await asyncio.sleep(5)
-                        elapsed_now = time.time() - start
-                        async with lock:
-                            channels_json[idx]['tested_seconds'] = int(elapsed_now)
-                            channels_json[idx]['resolution'] = last_resolution
-                            channels_json[idx]['details'] = last_notes
-                            with open(RESULTS_PATH, 'w', encoding='utf-8') as f:
-                                json.dump({'channels': channels_json, 'test_start': test_start, 'test_duration': duration_seconds, 'loop_mode': loop_mode, 'current_iteration': current_iteration}, f)
-                    except asyncio.CancelledError:
-                        break
-                    except Exception as e:
-                        pass
-
-            progress_task = asyncio.create_task(update_progress())
-
             try:
                 await asyncio.wait_for(proc.wait(), timeout=duration_seconds)
             except asyncio.TimeoutError:
@@ -139,20 +216,10 @@ async def run_checks_async(channels, duration_seconds=60, check_interval=1, cont
                 except Exception:
                     pass
             
-            # Cancel progress task
-            progress_task.cancel()
-            try:
-                await progress_task
-            except asyncio.CancelledError:
-                pass
-            except Exception:
-                pass
+            # Stop publishing progress for this channel
+            running.pop(idx, None)
             
-            # Wait for readers to finish
-            try:
-                await asyncio.wait_for(reader_out, timeout=2)
-            except Exception:
-                pass
+            # Wait for the reader to finish
             try:
                 await asyncio.wait_for(reader_err, timeout=2)
             except Exception:
@@ -160,17 +227,16 @@ async def run_checks_async(channels, duration_seconds=60, check_interval=1, cont
             
             elapsed = time.time() - start
             # update final stats
-            async with lock:
-                channels_json[idx]['status'] = 'pass' if (buffer_count == 0 and error_count == 0) else 'issue'
-                channels_json[idx]['details'] = last_notes
-                channels_json[idx]['resolution'] = last_resolution
-                channels_json[idx]['test_duration'] = ''
-                channels_json[idx]['tested_seconds'] = int(elapsed)
-                channels_json[idx]['issues'] = {'buffering': buffer_count, 'errors': error_count}
-                channels_json[idx]['disconnects_count'] = channels_json[idx].get('disconnects_count', 0)
-                channels_json[idx]['buffering_total_seconds'] = round(channels_json[idx].get('buffering_total_seconds', 0.0), 2)
-                with open(RESULTS_PATH, 'w', encoding='utf-8') as f:
-                    json.dump({'channels': channels_json, 'test_start': test_start, 'test_duration': duration_seconds, 'loop_mode': loop_mode, 'current_iteration': current_iteration}, f)
+            emit_patch(idx, {
+                'status': 'pass' if (buffer_count == 0 and error_count == 0) else 'issue',
+                'details': last_notes,
+                'resolution': last_resolution,
+                'test_duration': '',
+                'tested_seconds': int(elapsed),
+                'issues': {'buffering': buffer_count, 'errors': error_count},
+                'disconnects_count': channels_json[idx].get('disconnects_count', 0),
+                'buffering_total_seconds': round(channels_json[idx].get('buffering_total_seconds', 0.0), 2),
+            })
             return {'id': cid, 'name': name, 'url': url, 'result': channels_json[idx]['status'], 'notes': last_notes, 'issues': channels_json[idx]['issues']}
 
         # non-continuous (fallback to periodic probes)
@@ -186,50 +252,65 @@ async def run_checks_async(channels, duration_seconds=60, check_interval=1, cont
             last_notes = notes
             if resolution:
                 last_resolution = resolution
+            # Update running fields
+            fields = {
+                'status': 'testing',
+                'details': last_notes,
+                'resolution': last_resolution,
+                'test_duration': f"{single_probe_time:.2f}s" if single_probe_time else '',
+                'tested_seconds': int(time.time() - start),
+            }
+            entry = channels_json[idx]
+            appends = {}
             if r == 'buffering':
                 buffer_count += 1
                 buff_dur = float(single_probe_time) if single_probe_time else 0.0
-                async with lock:
-                    channels_json[idx]['buffering_events'].append(round(buff_dur, 2))
-                    channels_json[idx]['buffering_total_seconds'] += buff_dur
+                appends['buffering_events'] = round(buff_dur, 2)
+                fields['buffering_total_seconds'] = entry['buffering_total_seconds'] + buff_dur
             if r == 'error':
                 error_count += 1
-                async with lock:
-                    channels_json[idx]['disconnects_count'] += 1
-                    channels_json[idx]['disconnects'].append(int(time.time()))
-            # Update running fields under lock
-            async with lock:
-                channels_json[idx]['status'] = 'testing'
-                channels_json[idx]['details'] = last_notes
-                channels_json[idx]['resolution'] = last_resolution
-                channels_json[idx]['test_duration'] = f"{single_probe_time:.2f}s" if single_probe_time else ''
-                channels_json[idx]['tested_seconds'] = int(time.time() - start)
-                channels_json[idx]['issues'] = {'buffering': buffer_count, 'errors': error_count}
-                with open(RESULTS_PATH, 'w', encoding='utf-8') as f:
-                    json.dump({'channels': channels_json, 'test_start': test_start, 'test_duration': duration_seconds, 'loop_mode': loop_mode, 'current_iteration': current_iteration}, f)
+                appends['disconnects'] = int(time.time())
+                fields['disconnects_count'] = entry['disconnects_count'] + 1
+            fields['issues'] = {'buffering': buffer_count, 'errors': error_count}
+            emit_patch(idx, fields, appends)
             await asyncio.sleep(check_interval)
         # finalize
         final_status = 'pass' if (buffer_count == 0 and error_count == 0) else 'issue'
-        async with lock:
-            channels_json[idx]['status'] = final_status
-            channels_json[idx]['details'] = last_notes
-            channels_json[idx]['resolution'] = last_resolution
-            channels_json[idx]['test_duration'] = channels_json[idx].get('test_duration', '')
-            channels_json[idx]['tested_seconds'] = int(time.time() - start)
-            channels_json[idx]['issues'] = {'buffering': buffer_count, 'errors': error_count}
-            channels_json[idx]['disconnects_count'] = channels_json[idx].get('disconnects_count', 0)
-            channels_json[idx]['buffering_total_seconds'] = round(channels_json[idx].get('buffering_total_seconds', 0.0), 2)
-            with open(RESULTS_PATH, 'w', encoding='utf-8') as f:
-                json.dump({'channels': channels_json, 'test_start': test_start, 'test_duration': duration_seconds, 'loop_mode': loop_mode, 'current_iteration': current_iteration}, f)
+        emit_patch(idx, {
+            'status': final_status,
+            'details': last_notes,
+            'resolution': last_resolution,
+            'test_duration': channels_json[idx].get('test_duration', ''),
+            'tested_seconds': int(time.time() - start),
+            'issues': {'buffering': buffer_count, 'errors': error_count},
+            'disconnects_count': channels_json[idx].get('disconnects_count', 0),
+            'buffering_total_seconds': round(channels_json[idx].get('buffering_total_seconds', 0.0), 2),
+        })
         return {'id': cid, 'name': name, 'url': url, 'result': final_status, 'notes': last_notes, 'issues': channels_json[idx]['issues']}
-    # Run channels sequentially to isolate IPTV server performance from local system load
-    for i, ch in enumerate(channels):
-        res = await probe_channel(i, ch)
-        results.append(res)
+    # Probes are I/O bound, so overlap them; the semaphore keeps the load on
+    # the IPTV server bounded (max_concurrency=1 tests strictly sequentially)
+    sem = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _run(i, ch):
+        async with sem:
+            return await probe_channel(i, ch)
+
+    try:
+        results = await asyncio.gather(*[_run(i, ch) for i, ch in enumerate(channels)])
+    finally:
+        for task in (ticker_task, writer_task):
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        os.close(patch_fd)
+    # Final flush so the last updates are never left pending
+    write_state()
 
     return results
 
-async def prepare_and_run(m3u_source, duration_seconds=60, loop_mode='single', current_iteration=0):
+async def prepare_and_run(m3u_source, duration_seconds=60, loop_mode='single', current_iteration=0, max_concurrency=MAX_CONCURRENCY):
     ensure_dirs()
     await init_db()
 
@@ -237,35 +318,47 @@ async def prepare_and_run(m3u_source, duration_seconds=60, loop_mode='single', c
 
     # Read channel_selection.json if present
     selected_urls = None
-    if os.path.exists('channel_selection.json'):
-        try:
-            with open('channel_selection.json', 'r', encoding='utf-8') as f:
-                selected = json.load(f)
-                selected_urls = set([c['url'] for c in selected if 'url' in c])
-        except Exception as e:
-            print(f"[WARN] Could not read channel_selection.json: {e}")
+    selection_bytes = b''
+    try:
+        with open('channel_selection.json', 'rb') as f:
+            selection_bytes = f.read()
+        selected = json.loads(selection_bytes)
+        selected_urls = {c['url'] for c in selected if 'url' in c}
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[WARN] Could not read channel_selection.json: {e}")
 
-    if os.path.exists(m3u_source) and os.path.isfile(m3u_source):
+    if os.path.isfile(m3u_source):
         print('Reading local file', m3u_source)
-        txt = open(m3u_source, 'r', encoding='utf-8').read()
-        items = await parse_m3u(txt)
+        with open(m3u_source, 'rb') as f:
+            m3u_bytes = f.read()
     else:
-        import aiohttp
-        async with aiohttp.ClientSession() as session:
-            txt = await fetch_text(session, m3u_source)
-            items = await parse_m3u(txt)
+        m3u_bytes = (await fetch_text(m3u_source)).encode('utf-8')
+
+    # On later loop iterations an unchanged playlist + selection maps to the
+    # same channels, so the DB import and lookup can be skipped entirely
+    digest = hashlib.blake2b(m3u_bytes + b'\0' + selection_bytes, digest_size=16).digest()
+    if loop_mode in ('loop-times', 'infinite') and digest == _LAST_M3U['digest']:
+        channels_to_check = _LAST_M3U['channels']
+        print(f'Playlist unchanged, reusing {len(channels_to_check)} channels')
+    else:
+        items = parse_m3u(m3u_bytes.decode('utf-8'))
 
-    if selected_urls is not None:
-        items = [item for item in items if item[1] in selected_urls]
+        if selected_urls is not None:
+            items = [item for item in items if item[1] in selected_urls]
 
-    if not items:
-        print('No channels found in M3U (or after selection)')
-        return []
+        if not items:
+            print('No channels found in M3U (or after selection)')
+            return []
 
-    ids = await add_channels_bulk(items)
-    print(f'Imported {len(ids)} channels')
-    channels = await list_channels()
-    channels_to_check = [(c[0], c[1], c[2]) for c in channels if c[0] in set(ids)]
+        ids = await add_channels_bulk(items)
+        print(f'Imported {len(ids)} channels')
+        channels = await list_channels()
+        id_set = set(ids)
+        channels_to_check = [(c[0], c[1], c[2]) for c in channels if c[0] in id_set]
+        _LAST_M3U['digest'] = digest
+        _LAST_M3U['channels'] = channels_to_check
 
     if not channels_to_check:
         print('No channels to check')
@@ -276,9 +369,9 @@ async def prepare_and_run(m3u_source, duration_seconds=60, loop_mode='single', c
     
     # Load previous results if looping (to preserve buffering/disconnect counts across iterations)
     previous_counts = {}
-    if current_iteration > 1 and os.path.exists(RESULTS_PATH):
+    if current_iteration > 1:
         try:
-            with open(RESULTS_PATH, 'r', encoding='utf-8') as f:
+            with open(RESULTS_PATH, 'rb') as f:
                 prev_data = json.load(f)
                 for ch in prev_data.get('channels', []):
                     previous_counts[ch['name']] = {
@@ -308,11 +401,10 @@ async def prepare_and_run(m3u_source, duration_seconds=60, loop_mode='single', c
             'buffering_events': prev.get('buffering_events', [])
         })
     
-    with open(RESULTS_PATH, 'w', encoding='utf-8') as f:
-        json.dump({'channels': channels_json, 'test_start': test_start, 'test_duration': duration_seconds, 'loop_mode': loop_mode, 'current_iteration': current_iteration}, f)
+    _write_results({'channels': channels_json, 'test_start': test_start, 'test_duration': duration_seconds, 'loop_mode': loop_mode, 'current_iteration': current_iteration})
 
     print(f'Starting {len(channels_to_check)} checks (duration={duration_seconds}s)...')
-    results = await run_checks_async(channels_to_check, duration_seconds=duration_seconds, loop_mode=loop_mode, current_iteration=current_iteration, channels_json=channels_json)
+    results = await run_checks_async(channels_to_check, duration_seconds=duration_seconds, loop_mode=loop_mode, current_iteration=current_iteration, channels_json=channels_json, max_concurrency=max_concurrency)
 
     print('\nResults:')
     for r in results:
@@ -320,7 +412,30 @@ async def prepare_and_run(m3u_source, duration_seconds=60, loop_mode='single', c
 
     return results
 
+def _parse_m3u_file(path):
+    """Parse a local M3U file into a list of {'name', 'url'} dicts.
+
+    The file is memory-mapped and scanned with a single regex pass, so only
+    the extracted name/url fields are decoded.
+    """
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            return []
+    with mm:
+        return [
+            {
+                'name': m.group(1).decode('utf-8', 'replace').strip() if m.group(1) is not None else 'Unknown Channel',
+                'url': m.group(2).decode('utf-8', 'replace').strip(),
+            }
+            for m in _EXTINF_RE.finditer(mm)
+        ]
+
 # ---- Channel/Group Selection UI ----
+_DURATION_UNITS = {"seconds": 1, "minutes": 60, "hours": 3600, "days": 86400}
+
 def show_channel_selector(items):
     """Show a GUI popup to select channels/groups from M3U and test duration.
     
@@ -346,23 +461,16 @@ def show_channel_selector(items):
             groups[group] = []
         groups[group].append(item)
     
+    # Lowercased names are computed once here so filtering on each search
+    # is a plain substring test on precomputed keys
+    sorted_groups = [(group_name, group_name.lower()) for group_name in sorted(groups)]
+    lowered_names = {group_name: [(ch['name'].lower(), ch) for ch in channels] for group_name, channels in groups.items()}
+    
     def convert_duration():
         """Convert duration input to seconds."""
         try:
-            value = float(duration_value.get())
-            unit = duration_unit.get()
-            
-            if unit == "seconds":
-                return int(value)
-            elif unit == "minutes":
-                return int(value * 60)
-            elif unit == "hours":
-                return int(value * 3600)
-            elif unit == "days":
-                return int(value * 86400)
-            else:
-                return 15  # default
-        except ValueError:
+            return int(float(duration_value.get()) * _DURATION_UNITS[duration_unit.get()])
+        except (ValueError, KeyError):
             return 15  # default
     
     def on_submit():
@@ -370,16 +478,12 @@ def show_channel_selector(items):
         # Get all checked items
         selected_channels = []
         for group_name, channels in groups.items():
-            group_var = group_vars.get(group_name)
-            if group_var and group_var.get():
+            if group_name in selected_groups:
                 # Entire group selected
                 selected_channels.extend(channels)
             else:
                 # Check individual channels
-                for ch in channels:
-                    ch_var = channel_vars.get(ch['url'])
-                    if ch_var and ch_var.get():
-                        selected_channels.append(ch)
+                selected_channels.extend(ch for ch in channels if ch['url'] in selected_urls)
         
         selected_duration = convert_duration()
         root.quit()
@@ -392,72 +496,89 @@ def show_channel_selector(items):
         root.quit()
         root.destroy()
     
+    def refresh_marks(group_name):
+        """Redraw the check column for a group row and its channel rows."""
+        group_iid, rows = group_rows[group_name]
+        tree.set(group_iid, 'sel', CHECKED if group_name in selected_groups else UNCHECKED)
+        for _lname, ch, ch_iid in rows:
+            tree.set(ch_iid, 'sel', CHECKED if ch['url'] in selected_urls else UNCHECKED)
+    
     def toggle_group(group_name):
         """Toggle all channels in a group."""
-        state = group_vars[group_name].get()
-        for ch in groups[group_name]:
-            ch_var = channel_vars.get(ch['url'])
-            if ch_var:
-                ch_var.set(state)
+        state = group_name not in selected_groups
+        if state:
+            selected_groups.add(group_name)
+            selected_urls.update(ch['url'] for ch in groups[group_name])
+        else:
+            selected_groups.discard(group_name)
+            selected_urls.difference_update(ch['url'] for ch in groups[group_name])
+        refresh_marks(group_name)
+    
+    def toggle_item(iid):
+        kind, obj = tree_items[iid]
+        if kind == 'group':
+            toggle_group(obj)
+            return
+        if obj['url'] in selected_urls:
+            selected_urls.discard(obj['url'])
+        else:
+            selected_urls.add(obj['url'])
+        tree.set(iid, 'sel', CHECKED if obj['url'] in selected_urls else UNCHECKED)
+    
+    def on_tree_click(event):
+        # Only the check column toggles; clicks elsewhere keep normal
+        # Treeview behaviour (select row, expand/collapse group)
+        if tree.identify_column(event.x) != '#1':
+            return
+        iid = tree.identify_row(event.y)
+        if iid:
+            toggle_item(iid)
+    
+    def on_tree_space(event):
+        iid = tree.focus()
+        if iid:
+            toggle_item(iid)
     
     def on_search(*args):
+        """Schedule a filter pass, collapsing bursts of keystrokes into one."""
+        if pending_search[0]:
+            root.after_cancel(pending_search[0])
+        pending_search[0] = root.after(SEARCH_DEBOUNCE_MS, do_search)
+    
+    def build_tree():
+        """Insert every group and channel row once; searches only re-attach them."""
+        for group_name, _group_lname in sorted_groups:
+            group_iid = tree.insert('', 'end', values=(UNCHECKED,))
+            tree_items[group_iid] = ('group', group_name)
+            rows = []
+            for lname, ch in lowered_names[group_name]:
+                ch_iid = tree.insert(group_iid, 'end', text=ch['name'], values=(UNCHECKED,))
+                tree_items[ch_iid] = ('channel', ch)
+                rows.append((lname, ch, ch_iid))
+            group_rows[group_name] = (group_iid, rows)
+    
+    def do_search():
         """Filter groups and channels based on search query."""
+        pending_search[0] = None
         query = search_var.get().lower()
         
-        # Clear existing content
-        for widget in scrollable_frame.winfo_children():
-            widget.destroy()
-        
-        # Recreate filtered content
-        for group_name in sorted(groups.keys()):
-            # Check if group name matches or any channel in group matches
-            group_matches = query in group_name.lower()
-            matching_channels = [ch for ch in groups[group_name] if query in ch['name'].lower()]
-            
-            if not query or group_matches or matching_channels:
-                # Show group if it matches or has matching channels
-                channels_to_show = groups[group_name] if (not query or group_matches) else matching_channels
-                
-                group_frame = ttk.LabelFrame(scrollable_frame, text=f"{group_name} ({len(channels_to_show)} channels)", padding=10)
-                group_frame.pack(fill="x", padx=10, pady=5)
-                
-                group_var = group_vars.get(group_name)
-                if not group_var:
-                    group_var = tk.BooleanVar()
-                    group_vars[group_name] = group_var
-                
-                group_cb = ttk.Checkbutton(
-                    group_frame,
-                    text=f"Select all in {group_name}",
-                    variable=group_var,
-                    command=lambda gn=group_name: toggle_group(gn)
-                )
-                group_cb.pack(anchor="w")
-                
-                # Channel checkboxes
-                channel_frame = ttk.Frame(group_frame)
-                channel_frame.pack(fill="x", padx=20, pady=5)
-                
-                for ch in channels_to_show[:100]:  # Limit to first 100 channels per group
-                    ch_var = channel_vars.get(ch['url'])
-                    if not ch_var:
-                        ch_var = tk.BooleanVar()
-                        channel_vars[ch['url']] = ch_var
-                    
-                    ch_cb = ttk.Checkbutton(
-                        channel_frame,
-                        text=ch['name'][:100],  # Truncate long names
-                        variable=ch_var
-                    )
-                    ch_cb.pack(anchor="w")
-                
-                if len(channels_to_show) > 100:
-                    tk.Label(channel_frame, text=f"... and {len(channels_to_show) - 100} more channels", 
-                            fg="gray").pack(anchor="w")
-        
-        # Update scroll region
-        scrollable_frame.update_idletasks()
-        canvas.configure(scrollregion=canvas.bbox("all"))
+        # Rows are never destroyed or recreated: each group's matching rows are
+        # re-attached in one set_children call (the rest are detached), so Tk
+        # relayouts once per search instead of once per row
+        visible_groups = []
+        for group_name, group_lname in sorted_groups:
+            group_iid, rows = group_rows[group_name]
+            # Show group if it matches or has matching channels
+            if not query or query in group_lname:
+                rows_to_show = rows
+            else:
+                rows_to_show = [row for row in rows if query in row[0]]
+                if not rows_to_show:
+                    continue
+            tree.set_children(group_iid, *[ch_iid for _lname, _ch, ch_iid in rows_to_show])
+            tree.item(group_iid, text=f"{group_name} ({len(rows_to_show)} channels)", open=bool(query))
+            visible_groups.append(group_iid)
+        tree.set_children('', *visible_groups)
     
     root = tk.Tk()
     root.title("Select Channels to Test")
@@ -480,7 +601,7 @@ def show_channel_selector(items):
     duration_entry.pack(side="left", padx=5)
     
     duration_unit = tk.StringVar(value="seconds")
-    unit_options = ["seconds", "minutes", "hours", "days"]
+    unit_options = list(_DURATION_UNITS)
     duration_dropdown = ttk.Combobox(duration_input_frame, textvariable=duration_unit, values=unit_options, 
                                       state="readonly", width=15, font=("Arial", 10))
     duration_dropdown.pack(side="left", padx=5)
@@ -523,27 +644,32 @@ def show_channel_selector(items):
     search_entry = tk.Entry(search_frame, textvariable=search_var, font=("Arial", 10), width=50)
     search_entry.pack(side="left", fill="x", expand=True, padx=5)
     
-    # Scrollable frame
-    canvas = tk.Canvas(root)
-    scrollbar = ttk.Scrollbar(root, orient="vertical", command=canvas.yview)
-    scrollable_frame = ttk.Frame(canvas)
-    
-    scrollable_frame.bind(
-        "<Configure>",
-        lambda e: canvas.configure(scrollregion=canvas.bbox("all"))
-    )
-    
-    canvas.create_window((0, 0), window=scrollable_frame, anchor="nw")
-    canvas.configure(yscrollcommand=scrollbar.set)
-    
-    # Track checkbox variables
-    group_vars = {}
-    channel_vars = {}
+    # Channel tree: groups are parents, channels are children
+    tree_frame = tk.Frame(root)
+    tree_frame.pack(fill="both", expand=True, padx=10, pady=5)
+    tree = ttk.Treeview(tree_frame, columns=('sel',), show='tree')
+    tree.column('#0', stretch=True)
+    tree.column('sel', width=40, stretch=False, anchor='center')
+    scrollbar = ttk.Scrollbar(tree_frame, orient="vertical", command=tree.yview)
+    tree.configure(yscrollcommand=scrollbar.set)
+    tree.bind('<Button-1>', on_tree_click)
+    tree.bind('<space>', on_tree_space)
+    
+    # Track selection state (group names and channel urls) and the tree rows
+    CHECKED, UNCHECKED = '\u2611', '\u2610'
+    selected_groups = set()
+    selected_urls = set()
+    tree_items = {}
+    group_rows = {}
+    
+    # Id of the pending debounced search, if any
+    pending_search = [None]
     
     # Initial render with all groups/channels
-    on_search()
+    build_tree()
+    do_search()
     
-    canvas.pack(side="left", fill="both", expand=True)
+    tree.pack(side="left", fill="both", expand=True)
     scrollbar.pack(side="right", fill="y")
     
     # Buttons
@@ -573,132 +699,54 @@ def show_channel_selector(items):
 
 
 # ---- HTTP server helpers ----
-def start_http_server(port=HTTP_PORT):
-    import http.server
-    import socketserver
-    import subprocess
-
-    print(f"[DEBUG] Ensuring port {port} is free before starting HTTP server...")
-    # Always try to kill any process using the port with sudo before starting
-    try:
-        print(f"[DEBUG] Running 'sudo fuser -k {port}/tcp' to free port...")
-        subprocess.run(["sudo", "fuser", "-k", f"{port}/tcp"], check=False)
-    except Exception as e:
-        print(f"[DEBUG] sudo fuser failed: {e}")
+async def start_http_server(port=HTTP_PORT):
+    """Serve the repo directory from the running asyncio loop.
 
-    # Helper to test if port is free
-    import socket
-    def _port_in_use(p):
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        try:
-            s.bind(("0.0.0.0", p))
-            s.close()
-            return False
-        except OSError:
-            return True
-
-    # Retry a few times if port is still in use
-    max_kill_attempts = 5
-    for k in range(max_kill_attempts):
-        if not _port_in_use(port):
-            break
-        print(f"[DEBUG] Port {port} appears in use; retrying after sudo kill (attempt {k+1}/{max_kill_attempts})...")
-        time.sleep(1)
-    if _port_in_use(port):
-        print(f"[DEBUG] WARNING: port {port} still in use after sudo kill attempts; will proceed and retry starting server")
-
-    Handler = http.server.SimpleHTTPRequestHandler
-    for attempt in range(6):
+    The server shares the event loop with the probes, so no extra thread is
+    needed. Returns the AppRunner; call its cleanup() to stop serving.
+    """
+    from aiohttp import web
+
+    async def results_json(request):
+        if LATEST['bytes'] is None:
+            raise web.HTTPNotFound()
+        return web.Response(body=LATEST['bytes'], content_type='application/json', headers={'Cache-Control': 'no-store'})
+
+    app = web.Application()
+    # Registered before the static route so it wins for /results.json
+    app.router.add_get('/' + RESULTS_PATH, results_json)
+    app.router.add_static('/', '.')
+    runner = web.AppRunner(app)
+    await runner.setup()
+    for attempt in range(3):
         try:
             print(f"[DEBUG] Starting HTTP server (attempt {attempt+1})...")
-            with socketserver.TCPServer(("", port), Handler) as httpd:
-                print(f"[DEBUG] HTTP server started on port {port}.")
-                webbrowser.open(f'http://localhost:{port}/results.html')
-                httpd.serve_forever()
+            # Rebind immediately even if a previous run left the port in TIME_WAIT.
+            # No SO_REUSEPORT: a still-running instance must keep the port to itself.
+            site = web.TCPSite(runner, '0.0.0.0', port, reuse_address=True)
+            await site.start()
+            print(f"[DEBUG] HTTP server started on port {port}.")
+            webbrowser.open(f'http://localhost:{port}/results.html')
             break
         except OSError as e:
             print(f"[DEBUG] Port {port} is busy or failed to bind ({e}), retrying...")
-            time.sleep(1)
-
-
-if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print('Usage: run_local_test.py <m3u_url_or_path>')
-        sys.exit(1)
-
-    source = sys.argv[1]
-    # optional duration (seconds) argument
-    if len(sys.argv) >= 3:
-        try:
-            duration_seconds = int(sys.argv[2])
-        except Exception:
-            duration_seconds = 60
+            await asyncio.sleep(0.1)
     else:
-        duration_seconds = 60
+        await runner.cleanup()
+        print(f"[ERROR] Could not bind the dashboard to port {port}. Is another instance still running?")
+        sys.exit(1)
+    return runner
 
 
-    # Always reset results.json and start a new test run on each launch
-    def tests_runner():
-        import asyncio
-        # Remove old results.json if it exists to guarantee a fresh run
-        try:
-            if os.path.exists(RESULTS_PATH):
-                os.remove(RESULTS_PATH)
-        except Exception:
-            pass
+async def run_tests(source, duration_seconds, loop_mode, loop_iterations):
+    """Serve the dashboard and run the requested test iterations on one loop.
 
-        # Parse M3U file to get channels
-        m3u_path = source if os.path.exists(source) and os.path.isfile(source) else None
-        items = []
-        if m3u_path:
-            with open(m3u_path, 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            # Parse channels
-            i = 0
-            while i < len(lines):
-                line = lines[i].strip()
-                if line.startswith('#EXTINF'):
-                    # Extract channel name (after comma)
-                    name = line.split(',', 1)[1] if ',' in line else 'Unknown Channel'
-                    # next non-empty non-comment is URL
-                    j = i + 1
-                    while j < len(lines) and (not lines[j].strip() or lines[j].startswith('#')):
-                        j += 1
-                    url = lines[j].strip() if j < len(lines) else None
-                    if url:
-                        items.append({'name': name, 'url': url})
-                    i = j
-                i += 1
-            
-            # Show GUI selector
-            print(f"\n[INFO] Found {len(items)} channels. Opening channel selector...")
-            result = show_channel_selector(items)
-            selected, gui_duration, loop_mode, loop_iterations = result
-            
-            if selected is None or len(selected) == 0:
-                print("[INFO] No channels selected. Exiting.")
-                return
-            
-            print(f"[INFO] Selected {len(selected)} channels for testing.")
-            
-            # Use GUI duration if provided
-            if gui_duration is not None:
-                duration_seconds = gui_duration
-                print(f"[INFO] Test duration set to {duration_seconds} seconds")
-            
-            # Print loop settings
-            if loop_mode == "single":
-                print(f"[INFO] Loop mode: Single run")
-            elif loop_mode == "loop-times":
-                print(f"[INFO] Loop mode: Loop {loop_iterations} times")
-            elif loop_mode == "infinite":
-                print(f"[INFO] Loop mode: Infinite loop")
-            
-            # Write channel_selection.json for backend
-            with open('channel_selection.json', 'w', encoding='utf-8') as f:
-                json.dump(selected, f)
-        
-        # Loop implementation
+    Every iteration is awaited on the same loop, so the shared aiohttp session
+    (connection pool and DNS cache) survives between iterations. The HTTP
+    server keeps running after the tests finish until interrupted.
+    """
+    runner = await start_http_server(port=HTTP_PORT)
+    try:
         current_iteration = 0
         max_iterations = loop_iterations if loop_iterations and loop_iterations > 0 else 1
         
@@ -711,7 +759,7 @@ if __name__ == '__main__':
                 print(f"\n[INFO] Starting iteration {current_iteration} (infinite mode)")
             
             # Run the test
-            asyncio.run(prepare_and_run(source, duration_seconds=duration_seconds, loop_mode=loop_mode, current_iteration=current_iteration))
+            await prepare_and_run(source, duration_seconds=duration_seconds, loop_mode=loop_mode, current_iteration=current_iteration)
             
             # Check if we should continue looping
             if loop_mode == "single":
@@ -723,12 +771,73 @@ if __name__ == '__main__':
                 print(f"\n[INFO] Iteration {current_iteration} complete. Looping again...")
                 # Continue automatically
 
-    t = threading.Thread(target=tests_runner, daemon=True)
-    t.start()
+        # Keep serving results.html/results.json until Ctrl+C
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await close_session()
+        await close_db()
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('Usage: run_local_test.py <m3u_url_or_path>')
+        sys.exit(1)
+
+    source = sys.argv[1]
+    # optional duration (seconds) argument
+    if len(sys.argv) >= 3:
+        try:
+            duration_seconds = int(sys.argv[2])
+        except Exception:
+            duration_seconds = 60
+    else:
+        duration_seconds = 60
+
+    # Always reset results.json and start a new test run on each launch
+    try:
+        os.remove(RESULTS_PATH)
+    except OSError:
+        pass
+
+    loop_mode = 'single'
+    loop_iterations = None
+
+    # Parse M3U file to get channels
+    m3u_path = source if os.path.isfile(source) else None
+    if m3u_path:
+        items = _parse_m3u_file(m3u_path)
+        
+        # Show GUI selector
+        print(f"\n[INFO] Found {len(items)} channels. Opening channel selector...")
+        result = show_channel_selector(items)
+        selected, gui_duration, loop_mode, loop_iterations = result
+        
+        if selected is None or len(selected) == 0:
+            print("[INFO] No channels selected. Exiting.")
+            sys.exit(0)
+        
+        print(f"[INFO] Selected {len(selected)} channels for testing.")
+        
+        # Use GUI duration if provided
+        if gui_duration is not None:
+            duration_seconds = gui_duration
+            print(f"[INFO] Test duration set to {duration_seconds} seconds")
+        
+        # Print loop settings
+        if loop_mode == "single":
+            print(f"[INFO] Loop mode: Single run")
+        elif loop_mode == "loop-times":
+            print(f"[INFO] Loop mode: Loop {loop_iterations} times")
+        elif loop_mode == "infinite":
+            print(f"[INFO] Loop mode: Infinite loop")
+        
+        # Write channel_selection.json for backend
+        with open('channel_selection.json', 'w', encoding='utf-8') as f:
+            json.dump(selected, f)
 
-    # Start HTTP server in main thread (blocking) so results.html can be fetched via HTTP
+    # The HTTP server and the tests share a single asyncio loop
     try:
-        start_http_server(port=HTTP_PORT)
+        asyncio.run(run_tests(source, duration_seconds, loop_mode, loop_iterations))
     except KeyboardInterrupt:
         print('\n[INFO] HTTP server stopped.')
-
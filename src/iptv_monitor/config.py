@@ -3,9 +3,11 @@ from pathlib import Path
 
 CONFIG_DIR = Path(os.environ.get('XDG_CONFIG_HOME', Path.home() / '.config')) / 'iptv-monitor'
 DATA_DIR = Path(os.environ.get('XDG_DATA_HOME', Path.home() / '.local' / 'share')) / 'iptv-monitor'
+CACHE_DIR = Path(os.environ.get('XDG_CACHE_HOME', Path.home() / '.cache')) / 'iptv-monitor'
 CONFIG_FILE = CONFIG_DIR / 'config.json'
 DB_FILE = DATA_DIR / 'data.sqlite'
 LOG_FILE = DATA_DIR / 'app.log'
+M3U_CACHE_FILE = CACHE_DIR / 'm3u_cache.json'
 
 DEFAULTS = {
     'check_interval_sec': 900,  # 15 minutes
@@ -15,5 +17,6 @@ DEFAULTS = {
 def ensure_dirs():
     CONFIG_DIR.mkdir(parents=True, exist_ok=True)
     DATA_DIR.mkdir(parents=True, exist_ok=True)
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
 
 ensure_dirs()
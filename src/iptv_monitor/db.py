@@ -1,3 +1,4 @@
+import asyncio
 import aiosqlite
 from .config import DB_FILE
 
@@ -23,54 +24,95 @@ CREATE TABLE IF NOT EXISTS results (
 );
 '''
 
+# bumped whenever channels are inserted, so callers can cache list_channels()
+_channels_version = 0
+
+# one long-lived connection shared by every query; opened by get_conn()
+_conn = None
+_conn_lock = asyncio.Lock()
+
+def channels_version():
+    return _channels_version
+
+def _bump_channels_version():
+    global _channels_version
+    _channels_version += 1
+
+async def get_conn():
+    """Return the shared connection, opening it in WAL mode on first use.
+
+    WAL with synchronous=NORMAL lets readers run alongside the writer and
+    avoids an fsync per commit.
+    """
+    global _conn
+    async with _conn_lock:
+        if _conn is None:
+            conn = await aiosqlite.connect(DB_FILE)
+            await conn.executescript('PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL; PRAGMA temp_store=MEMORY;')
+            _conn = conn
+    return _conn
+
+async def close_db():
+    """Close the shared connection (call on shutdown)."""
+    global _conn
+    if _conn is not None:
+        await _conn.close()
+        _conn = None
+
 async def init_db():
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute(CREATE_CHANNELS)
-        await db.execute(CREATE_RESULTS)
-        await db.commit()
+    db = await get_conn()
+    await db.execute(CREATE_CHANNELS)
+    await db.execute(CREATE_RESULTS)
+    await db.commit()
 
 async def add_channel(name, url):
-    async with aiosqlite.connect(DB_FILE) as db:
-        # avoid duplicate by url
-        cur = await db.execute('SELECT id FROM channels WHERE url = ?', (url,))
-        row = await cur.fetchone()
-        if row:
-            return row[0]
-        await db.execute('INSERT INTO channels (name, url) VALUES (?,?)', (name, url))
-        await db.commit()
-        cur = await db.execute('SELECT last_insert_rowid()')
-        r = await cur.fetchone()
-        return r[0]
+    db = await get_conn()
+    # avoid duplicate by url
+    cur = await db.execute('SELECT id FROM channels WHERE url = ?', (url,))
+    row = await cur.fetchone()
+    if row:
+        return row[0]
+    cur = await db.execute('INSERT INTO channels (name, url) VALUES (?,?)', (name, url))
+    await db.commit()
+    _bump_channels_version()
+    return cur.lastrowid
 
 async def add_channels_bulk(ch_list):
     """ch_list: iterable of (name,url) - adds if not present, returns list of ids"""
     ids = []
-    async with aiosqlite.connect(DB_FILE) as db:
-        for name, url in ch_list:
-            cur = await db.execute('SELECT id FROM channels WHERE url = ?', (url,))
-            row = await cur.fetchone()
-            if row:
-                ids.append(row[0])
-                continue
-            await db.execute('INSERT INTO channels (name, url) VALUES (?,?)', (name, url))
-            await db.commit()
-            cur = await db.execute('SELECT last_insert_rowid()')
-            r = await cur.fetchone()
-            ids.append(r[0])
+    added = False
+    db = await get_conn()
+    for name, url in ch_list:
+        cur = await db.execute('SELECT id FROM channels WHERE url = ?', (url,))
+        row = await cur.fetchone()
+        if row:
+            ids.append(row[0])
+            continue
+        cur = await db.execute('INSERT INTO channels (name, url) VALUES (?,?)', (name, url))
+        ids.append(cur.lastrowid)
+        added = True
+    if added:
+        await db.commit()
+        _bump_channels_version()
     return ids
 
 async def list_channels():
-    async with aiosqlite.connect(DB_FILE) as db:
-        cur = await db.execute('SELECT id, name, url FROM channels')
-        rows = await cur.fetchall()
-        return rows
+    db = await get_conn()
+    cur = await db.execute('SELECT id, name, url FROM channels')
+    return await cur.fetchall()
 
 async def insert_result(channel_id, result, notes='', throughput=None, startup=None):
-    async with aiosqlite.connect(DB_FILE) as db:
-        await db.execute('INSERT INTO results (channel_id, result, notes, throughput_mbps, startup_estimate_s) VALUES (?,?,?,?,?)', (channel_id, result, notes, throughput, startup))
-        await db.commit()
+    db = await get_conn()
+    await db.execute('INSERT INTO results (channel_id, result, notes, throughput_mbps, startup_estimate_s) VALUES (?,?,?,?,?)', (channel_id, result, notes, throughput, startup))
+    await db.commit()
+
+async def insert_results_bulk(rows):
+    """rows: iterable of (channel_id, result, notes, throughput, startup) - one transaction"""
+    db = await get_conn()
+    await db.executemany('INSERT INTO results (channel_id, result, notes, throughput_mbps, startup_estimate_s) VALUES (?,?,?,?,?)', rows)
+    await db.commit()
 
 async def recent_results(channel_id, window_hours=24):
-    async with aiosqlite.connect(DB_FILE) as db:
-        cur = await db.execute('SELECT timestamp, result, notes, throughput_mbps, startup_estimate_s FROM results WHERE channel_id=? AND timestamp >= datetime("now", ?)', (channel_id, f'-{window_hours} hours'))
-        return await cur.fetchall()
+    db = await get_conn()
+    cur = await db.execute('SELECT timestamp, result, notes, throughput_mbps, startup_estimate_s FROM results WHERE channel_id=? AND timestamp >= datetime("now", ?)', (channel_id, f'-{window_hours} hours'))
+    return await cur.fetchall()
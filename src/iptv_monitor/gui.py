@@ -1,19 +1,19 @@
 import asyncio
-import threading
 import gi
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GObject
-from .db import init_db, list_channels, add_channel, recent_results
-from .worker import Monitor
+from gi.repository import Gtk, GObject, GLib
+from .db import init_db, close_db, list_channels, add_channel, recent_results
+from .worker import Monitor, close_session, save_m3u_cache
 from .config import DEFAULTS
 
 class MainWindow(Gtk.Window):
-    def __init__(self):
+    def __init__(self, loop):
         super().__init__(title="IPTV Monitor")
         self.set_default_size(800, 480)
 
         self.monitor = None
-        self.loop = asyncio.get_event_loop()
+        # asyncio loop driven by the GLib main loop; coroutines run on the UI thread
+        self.loop = loop
 
         header = Gtk.HeaderBar(title="IPTV Monitor")
         header.set_show_close_button(True)
@@ -37,7 +37,9 @@ class MainWindow(Gtk.Window):
         grid.attach(vleft, 0, 0, 1, 1)
 
         self.liststore = Gtk.ListStore(int, str, str)
-        tree = Gtk.TreeView(self.liststore)
+        # ids currently in liststore, so load_data only applies the difference
+        self._channel_ids = set()
+        self.tree = tree = Gtk.TreeView(self.liststore)
         for i, title in enumerate(['id','name','url']):
             renderer = Gtk.CellRendererText()
             col = Gtk.TreeViewColumn(title, renderer, text=i)
@@ -70,9 +72,18 @@ class MainWindow(Gtk.Window):
         vright.pack_start(history_view, True, True, 0)
 
         refresh_btn = Gtk.Button(label='Refresh')
-        refresh_btn.connect('clicked', lambda b: asyncio.run_coroutine_threadsafe(self.load_data(), self.loop))
+        refresh_btn.connect('clicked', lambda b: self.loop.create_task(self.load_data()))
         vright.pack_start(refresh_btn, False, False, 0)
 
+        # initialize DB and load
+        self.loop.create_task(self._init_async())
+
+    def _show_message(self, msg_type, text):
+        # Non-blocking: dialog.run() would start a nested main loop inside a task
+        dlg = Gtk.MessageDialog(self, 0, msg_type, Gtk.ButtonsType.OK, text)
+        dlg.connect('response', lambda d, _r: d.destroy())
+        dlg.show_all()
+
     def on_import(self, _):
         dialog = Gtk.Dialog(title='Import M3U', transient_for=self, flags=0)
         dialog.add_buttons(Gtk.STOCK_CANCEL, Gtk.ResponseType.CANCEL, Gtk.STOCK_OK, Gtk.ResponseType.OK)
@@ -96,38 +107,39 @@ class MainWindow(Gtk.Window):
         source = entry.get_text().strip()
         dialog.destroy()
         if resp == Gtk.ResponseType.OK and source:
-            future = asyncio.run_coroutine_threadsafe(self._import_and_run(source), self.loop)
-            # show a small waiting dialog
+            # show a small non-modal waiting dialog; the handler returns right
+            # away so GTK keeps repainting while the import runs
             wait = Gtk.MessageDialog(self, 0, Gtk.MessageType.INFO, Gtk.ButtonsType.NONE, 'Importing...')
             wait.show_all()
-            try:
-                results, imported = future.result(timeout=120)
-            except Exception as e:
-                wait.destroy()
-                err = Gtk.MessageDialog(self, 0, Gtk.MessageType.ERROR, Gtk.ButtonsType.OK, f'Import failed: {e}')
-                err.run(); err.destroy()
-                return
-            wait.destroy()
-            # refresh UI
-            asyncio.run_coroutine_threadsafe(self.load_data(), self.loop)
-            # show summary of imported channels and note background checks
-            if results:
-                msg = f'Imported {imported} channels. Ran {len(results)} checks.\n\nSample results:\n'
-                for r in results[:5]:
-                    msg += f"{r['name']}: {r['result']} ({r['notes']})\n"
-            else:
-                msg = f'Imported {imported} channels. Checks started in background — click Refresh to see results.'
-            dlg = Gtk.MessageDialog(self, 0, Gtk.MessageType.INFO, Gtk.ButtonsType.OK, msg)
-            dlg.run(); dlg.destroy()
+            task = self.loop.create_task(asyncio.wait_for(self._import_and_run(source), timeout=120))
+            task.add_done_callback(lambda t: GLib.idle_add(self._on_import_done, t, wait))
+
+    def _on_import_done(self, task, wait):
+        wait.destroy()
+        if task.cancelled():
+            return False
+        exc = task.exception()
+        if exc is not None:
+            self._show_message(Gtk.MessageType.ERROR, f'Import failed: {exc}')
+            return False
+        results, imported = task.result()
+        # refresh UI
+        self.loop.create_task(self.load_data())
+        # show summary of imported channels and note background checks
+        if results:
+            msg = f'Imported {imported} channels. Ran {len(results)} checks.\n\nSample results:\n'
+            for r in results[:5]:
+                msg += f"{r['name']}: {r['result']} ({r['notes']})\n"
+        else:
+            msg = f'Imported {imported} channels. Checks started in background — click Refresh to see results.'
+        self._show_message(Gtk.MessageType.INFO, msg)
+        return False
 
     async def _import_and_run(self, url):
         # fetch M3U and parse, add channels, and start background checks (non-blocking)
-        import aiohttp
-        from .worker import fetch_text, parse_m3u, run_checks_concurrent
+        from .worker import fetch_m3u, run_checks_concurrent
         from .db import add_channels_bulk, list_channels
-        async with aiohttp.ClientSession() as session:
-            txt = await fetch_text(session, url)
-            items = await parse_m3u(txt)
+        items = await fetch_m3u(url)
         if not items:
             return [], 0
         added_ids = await add_channels_bulk(items)
@@ -141,18 +153,34 @@ class MainWindow(Gtk.Window):
         # return immediately so the dialog can close and UI can refresh
         return [], len(items)
 
-        # initialize DB and load
-        threading.Thread(target=self._init_async).start()
-
-    def _init_async(self):
-        asyncio.run(init_db())
-        asyncio.run(self.load_data())
+    async def _init_async(self):
+        await init_db()
+        await self.load_data()
 
     async def load_data(self):
-        self.liststore.clear()
         channels = await list_channels()
-        for c in channels:
-            self.liststore.append(list(c))
+        # store mutations go through the GTK main context, never straight from a coroutine
+        GLib.idle_add(self._apply_channels, channels)
+
+    def _apply_channels(self, channels):
+        incoming = {c[0] for c in channels}
+        self.tree.freeze_child_notify()
+        try:
+            if self._channel_ids - incoming:
+                it = self.liststore.get_iter_first()
+                while it is not None:
+                    if self.liststore[it][0] in incoming:
+                        it = self.liststore.iter_next(it)
+                    elif not self.liststore.remove(it):
+                        # remove() advances it to the next row; False means it was the last
+                        it = None
+            for c in channels:
+                if c[0] not in self._channel_ids:
+                    self.liststore.insert_with_valuesv(-1, [0, 1, 2], c)
+        finally:
+            self.tree.thaw_child_notify()
+        self._channel_ids = incoming
+        return False
 
     def on_add(self, _):
         name = self.name_entry.get_text().strip()
@@ -160,23 +188,24 @@ class MainWindow(Gtk.Window):
         if not name or not url:
             dialog = Gtk.MessageDialog(self, 0, Gtk.MessageType.ERROR, Gtk.ButtonsType.OK, 'Name and URL required')
             dialog.run(); dialog.destroy(); return
-        asyncio.run_coroutine_threadsafe(add_channel(name, url), self.loop).result()
-        asyncio.run_coroutine_threadsafe(self.load_data(), self.loop)
+        self.loop.create_task(self._add_and_reload(name, url))
         self.name_entry.set_text('')
         self.url_entry.set_text('')
 
+    async def _add_and_reload(self, name, url):
+        await add_channel(name, url)
+        await self.load_data()
+
     def on_start(self, _):
-        if self.monitor and self.monitor._running:
+        if self.monitor and self.monitor.running:
             return
         # run monitor in asyncio background task
         self.monitor = Monitor(None, interval=DEFAULTS['check_interval_sec'])
         # start monitor as background task
-        asyncio.run_coroutine_threadsafe(self._start_monitor(), self.loop)
+        self.loop.create_task(self._start_monitor())
 
     async def _start_monitor(self):
-        self.monitor._running = True
-        # start loop task
-        self.monitor._task = asyncio.create_task(self.monitor._loop())
+        self.monitor.start()
 
     def on_stop(self, _):
         if not self.monitor:
@@ -184,7 +213,20 @@ class MainWindow(Gtk.Window):
         self.monitor.stop()
 
 def run_app():
-    win = MainWindow()
-    win.connect('destroy', Gtk.main_quit)
+    # Let the GLib main loop drive asyncio (PyGObject >= 3.50), so there is
+    # a single loop on the UI thread instead of a helper thread
+    from gi.events import GLibEventLoopPolicy
+    asyncio.set_event_loop_policy(GLibEventLoopPolicy())
+    loop = asyncio.get_event_loop()
+    win = MainWindow(loop)
+    async def shutdown():
+        await close_session()
+        await close_db()
+    def on_destroy(_w):
+        # persist the playlist cache, release pooled HTTP connections and the db before quitting
+        save_m3u_cache()
+        task = loop.create_task(shutdown())
+        task.add_done_callback(lambda _t: loop.stop())
+    win.connect('destroy', on_destroy)
     win.show_all()
-    Gtk.main()
+    loop.run_forever()
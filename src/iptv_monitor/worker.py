@@ -1,150 +1,433 @@
 import asyncio
 import aiohttp
+import json
+import os
+import random
+import re
 import time
-from .db import insert_result
+from collections import OrderedDict, deque
+from urllib.parse import urlparse
+from .config import M3U_CACHE_FILE
+from .db import insert_result, insert_results_bulk
 
-async def fetch_text(session, url, timeout=15):
+# '#EXTINF...,NAME' followed by the next non-empty, non-comment line (the URL)
+_M3U_RE = re.compile(r'^#EXTINF[^\n]*?(?:,([^\n]*))?\n(?:[ \t\r]*\n|#[^\n]*\n)*[ \t]*([^#\s][^\n]*)', re.MULTILINE)
+
+# ffprobe -show_streams/-show_format output fields used by check_ts
+_RE_W = re.compile(r'width=(\d+)')
+_RE_H = re.compile(r'height=(\d+)')
+_RE_DUR = re.compile(r'duration=([\d.]+)')
+_RE_FFPROBE_MARKERS = re.compile(r'codec_type=video|codec_type=audio|error|buffer')
+
+RESULT_FLUSH_BATCH = 500  # rows per executemany in run_checks_concurrent
+RESULT_FLUSH_MAX_AGE = 5  # seconds a buffered result may wait before its batch is written
+PREFLIGHT_TIMEOUT = 5  # seconds for the HEAD request check_ts sends before ffprobe
+RETRY_BASE_DELAY = 0.5  # seconds; doubles per attempt, with full jitter
+RETRY_MAX_DELAY = 30
+FETCH_PROBE_BYTES = 256 * 1024  # fetch_bytes stops reading after this much
+PROBE_CACHE_SIZE = 10000  # urls remembered by check_ts_cached
+PROBE_TTL_ERROR = 60  # seconds an 'error' result is reused
+PROBE_TTL_OK = 300  # seconds any other result is reused
+
+_session = None
+# url -> (etag, last_modified, parsed items); loaded from M3U_CACHE_FILE on first use
+_m3u_cache = None
+# url -> (expires_at, check_ts result), least recently used first
+_probe_cache = OrderedDict()
+
+async def get_session():
+    """Return the shared ClientSession, creating it on first use.
+
+    Reusing one pooled session keeps TCP/TLS connections and DNS lookups
+    alive across playlist fetches and stream checks.
+    """
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=100, limit_per_host=10, ttl_dns_cache=300, enable_cleanup_closed=True),
+            timeout=aiohttp.ClientTimeout(total=60, connect=10),
+            headers={"User-Agent": "IPTVMonitor/1.0"},
+        )
+    return _session
+
+async def close_session():
+    """Close the shared ClientSession (call on shutdown)."""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
+
+class _ClientHTTPError(Exception):
+    """4xx response: retrying won't help, so fetches fail immediately."""
+
+def _retry_delay(attempt):
+    # exponential backoff with full jitter, so failing checks don't retry in lockstep
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+async def fetch_text(url, session=None, timeout=15):
+    _status, _headers, txt = await _fetch_text_response(url, session=session, timeout=timeout)
+    return txt
+
+async def _fetch_text_response(url, session=None, timeout=15, headers=None):
+    """GET url and return (status, response headers, text).
+
+    A 304 is returned as-is (with empty text) for conditional requests.
+    """
     # Add diagnostics and retry logic
+    if session is None:
+        session = await get_session()
     max_attempts = 3
-    delay = 2
     last_exc = None
     for attempt in range(max_attempts):
         try:
-            async with session.get(url, timeout=timeout, headers={"User-Agent": "IPTVMonitor/1.0"}) as r:
+            async with session.get(url, timeout=timeout, headers=headers) as r:
                 status = r.status
                 ctype = r.headers.get('Content-Type', '')
-                try:
-                    txt = await r.text()
-                except Exception as e:
-                    # Try to get first bytes for diagnostics
-                    raw = await r.read()
-                    first_bytes = raw[:32]
-                    raise Exception(f"decode error: {e}; status={status}; content-type={ctype}; first_bytes={first_bytes}")
+                if status == 304:
+                    return status, r.headers, ''
+                if 400 <= status < 500:
+                    raise _ClientHTTPError(f"HTTP {status} {ctype}")
                 if status != 200:
                     raise Exception(f"HTTP {status} {ctype}")
-                return txt
+                # decode ourselves: r.text() falls back to slow charset sniffing
+                raw = await r.read()
+                txt = raw.decode(r.charset or 'utf-8', errors='replace')
+                return status, r.headers, txt
+        except _ClientHTTPError:
+            raise
         except Exception as e:
             last_exc = e
-            await asyncio.sleep(delay * (attempt + 1))
+            if attempt + 1 < max_attempts:
+                await asyncio.sleep(_retry_delay(attempt))
     raise Exception(f"fetch_text failed after {max_attempts} attempts: {last_exc}")
 
-async def fetch_bytes(session, url, timeout=15):
+async def fetch_bytes(url, session=None, timeout=15):
+    if session is None:
+        session = await get_session()
     start = time.time()
     max_attempts = 2
-    delay = 2
     last_exc = None
     for attempt in range(max_attempts):
         try:
-            async with session.get(url, timeout=timeout, headers={"User-Agent": "IPTVMonitor/1.0"}) as r:
+            async with session.get(url, timeout=timeout) as r:
                 status = r.status
                 ctype = r.headers.get('Content-Type', '')
+                if 400 <= status < 500:
+                    raise _ClientHTTPError(f"HTTP {status} {ctype}")
                 if status != 200:
                     raise Exception(f"HTTP {status} {ctype}")
-                data = await r.read()
+                # a bounded sample is enough to measure throughput
+                total = 0
+                async for chunk in r.content.iter_chunked(32768):
+                    total += len(chunk)
+                    if total >= FETCH_PROBE_BYTES:
+                        break
                 elapsed = time.time() - start
-                return len(data), elapsed
+                return total, elapsed
+        except _ClientHTTPError:
+            raise
         except Exception as e:
             last_exc = e
-            await asyncio.sleep(delay * (attempt + 1))
+            if attempt + 1 < max_attempts:
+                await asyncio.sleep(_retry_delay(attempt))
     raise Exception(f"fetch_bytes failed after {max_attempts} attempts: {last_exc}")
 
-async def parse_m3u(text):
+def parse_m3u(text):
     """Parse a plain M3U playlist and return list of (name,url)"""
-    lines = [l.strip() for l in text.splitlines()]
+    items = _parse_m3u_fast(text)
+    if items is None:
+        items = [
+            ((m.group(1).strip() if m.group(1) is not None else 'unknown'), m.group(2).strip())
+            for m in _M3U_RE.finditer(text)
+        ]
+    return items
+
+def _parse_m3u_fast(text):
+    """str.split parser for the common strict '#EXTINF...,NAME' / 'URL' layout.
+
+    Returns None as soon as a block doesn't fit that layout (no name, comment
+    or blank line before the URL, ...), leaving it to the regex parser.
+    """
     items = []
-    i = 0
-    while i < len(lines):
-        line = lines[i]
-        if line.startswith('#EXTINF'):
-            name = line.split(',', 1)[1] if ',' in line else 'unknown'
-            # next non-empty non-comment is URL
-            j = i + 1
-            while j < len(lines) and (not lines[j] or lines[j].startswith('#')):
-                j += 1
-            url = lines[j] if j < len(lines) else None
-            if url:
-                items.append((name, url))
-            i = j
-        i += 1
+    for block in ('\n' + text).split('\n#EXTINF')[1:]:
+        meta, sep, rest = block.partition('\n')
+        _attrs, comma, name = meta.partition(',')
+        if not sep or not comma:
+            return None
+        url = rest.partition('\n')[0].strip()
+        if not url or url[0] == '#':
+            return None
+        items.append((name.strip(), url))
     return items
 
-async def fetch_m3u(session, url):
-    txt = await fetch_text(session, url)
-    return await parse_m3u(txt)
+def _load_m3u_cache():
+    global _m3u_cache
+    if _m3u_cache is None:
+        _m3u_cache = {}
+        try:
+            with open(M3U_CACHE_FILE, 'r', encoding='utf-8') as f:
+                for url, (etag, last_modified, items) in json.load(f).items():
+                    _m3u_cache[url] = (etag, last_modified, [tuple(i) for i in items])
+        except FileNotFoundError:
+            pass
+        except Exception:
+            # a corrupt cache only costs a full download
+            _m3u_cache = {}
+    return _m3u_cache
+
+def save_m3u_cache():
+    """Persist the playlist cache so cold starts can revalidate instead of re-download."""
+    if not _m3u_cache:
+        return
+    tmp_path = M3U_CACHE_FILE.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(_m3u_cache, f)
+    os.replace(tmp_path, M3U_CACHE_FILE)
+
+async def fetch_m3u(url, session=None):
+    """Fetch and parse a playlist, skipping download and parse if unchanged.
+
+    The parsed items are cached per URL with the response ETag/Last-Modified;
+    later fetches send a conditional GET and reuse the items on a 304.
+    """
+    cache = _load_m3u_cache()
+    cached = cache.get(url)
+    headers = {}
+    if cached:
+        etag, last_modified, _items = cached
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+    status, resp_headers, txt = await _fetch_text_response(url, session=session, headers=headers or None)
+    if status == 304 and cached:
+        return list(cached[2])
+    items = parse_m3u(txt)
+    etag = resp_headers.get('ETag')
+    last_modified = resp_headers.get('Last-Modified')
+    if etag or last_modified:
+        cache[url] = (etag, last_modified, items)
+    else:
+        cache.pop(url, None)
+    return items
 
 
 async def check_ts(url, per_check_timeout=15):
     """Check a direct TS stream: fetch first chunk, measure throughput, and report status."""
-    import subprocess
-    async def _check():
+    start_time = time.time()
+    if url.startswith(('http://', 'https://')):
+        # cheap HTTP pre-flight: dead channels fail here without spawning ffprobe
         try:
-            start_time = time.time()
-            ffprobe_cmd = ["ffprobe", "-v", "error", "-show_streams", "-show_format", "-i", url]
-            proc = subprocess.run(ffprobe_cmd, capture_output=True, text=True, timeout=15)
-            ffprobe_out = proc.stdout
-            ffprobe_err = proc.stderr
-            buffering = False
-            notes = ""
-            resolution = ""
-            duration = None
-            if proc.returncode != 0:
-                notes += f"ffprobe error: {ffprobe_err.strip()}"
-                buffering = True
-            else:
-                # Extract video resolution
-                import re
-                if "codec_type=video" in ffprobe_out:
-                    notes += "[video detected] "
-                if "codec_type=audio" in ffprobe_out:
-                    notes += "[audio detected] "
-                w = re.search(r'width=(\d+)', ffprobe_out)
-                h = re.search(r'height=(\d+)', ffprobe_out)
-                if w and h:
-                    resolution = f"{w.group(1)}x{h.group(1)}"
-                    notes = (notes + f"[video detected {resolution}] ").strip()
-                # Extract duration
-                dur_match = re.search(r'duration=([\d\.]+)', ffprobe_out)
-                if dur_match:
-                    duration = float(dur_match.group(1))
-                # Check for stalls/buffering
-                if "error" in ffprobe_out or "buffer" in ffprobe_out:
-                    buffering = True
-                    notes += "[ffprobe buffering] "
-
-            result = 'buffering' if buffering else 'pass'
-            test_duration = time.time() - start_time
-            return result, notes.strip(), resolution, test_duration
-        except Exception as e:
-            return 'error', str(e), None, None
+            session = await get_session()
+            # the pre-flight spends from the same per_check_timeout budget as ffprobe
+            preflight_timeout = min(PREFLIGHT_TIMEOUT, per_check_timeout)
+            async with session.head(url, timeout=aiohttp.ClientTimeout(total=preflight_timeout), allow_redirects=True) as r:
+                # some IPTV servers don't implement HEAD; let ffprobe decide then
+                if r.status >= 400 and r.status not in (405, 501):
+                    return 'error', f'HTTP {r.status}', None, time.time() - start_time
+        except asyncio.TimeoutError:
+            return 'error', 'timeout', None, time.time() - start_time
+        except aiohttp.ClientError as e:
+            return 'error', str(e), None, time.time() - start_time
+    try:
+        # async subprocess so concurrent checks (and the GUI loop) keep running
+        proc = await asyncio.create_subprocess_exec(
+            "ffprobe", "-v", "error", "-probesize", "500000", "-analyzeduration", "500000",
+            "-show_streams", "-show_format", "-i", url,
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+    except Exception as e:
+        return 'error', str(e), None, None
     try:
-        return await asyncio.wait_for(_check(), timeout=per_check_timeout)
+        remaining = max(0, per_check_timeout - (time.time() - start_time))
+        out, err = await asyncio.wait_for(proc.communicate(), timeout=remaining)
     except asyncio.TimeoutError:
-        return 'error', 'timeout', None, None
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+        await proc.wait()
+        return 'error', 'timeout', None, time.time() - start_time
     except Exception as e:
         return 'error', str(e), None, None
+    try:
+        ffprobe_out = out.decode('utf-8', errors='replace')
+        ffprobe_err = err.decode('utf-8', errors='replace')
+        buffering = False
+        notes = ""
+        resolution = ""
+        duration = None
+        if proc.returncode != 0:
+            notes += f"ffprobe error: {ffprobe_err.strip()}"
+            buffering = True
+        else:
+            # one scan collects every stream/stall marker present in the output
+            markers = set(_RE_FFPROBE_MARKERS.findall(ffprobe_out))
+            if "codec_type=video" in markers:
+                notes += "[video detected] "
+            if "codec_type=audio" in markers:
+                notes += "[audio detected] "
+            # Extract video resolution
+            w = _RE_W.search(ffprobe_out)
+            h = _RE_H.search(ffprobe_out)
+            if w and h:
+                resolution = f"{w.group(1)}x{h.group(1)}"
+                notes = (notes + f"[video detected {resolution}] ").strip()
+            # Extract duration
+            dur_match = _RE_DUR.search(ffprobe_out)
+            if dur_match:
+                duration = float(dur_match.group(1))
+            # Check for stalls/buffering
+            if "error" in markers or "buffer" in markers:
+                buffering = True
+                notes += "[ffprobe buffering] "
+
+        result = 'buffering' if buffering else 'pass'
+        test_duration = time.time() - start_time
+        return result, notes.strip(), resolution, test_duration
+    except Exception as e:
+        return 'error', str(e), None, None
+
+def _probe_cache_get(url):
+    """Return the memoized check_ts result for url, or None if missing/expired."""
+    entry = _probe_cache.get(url)
+    if entry and entry[0] > time.monotonic():
+        _probe_cache.move_to_end(url)
+        return entry[1]
+    return None
+
+async def check_ts_cached(url, per_check_timeout=15, max_ttl=None):
+    """check_ts memoized per URL, so repeated passes don't re-probe every stream.
+
+    Errors are reused for PROBE_TTL_ERROR seconds, other results for PROBE_TTL_OK,
+    both capped at max_ttl if given. Callers that store results should skip
+    storing cache hits (see _probe_cache_get); they were stored when probed.
+    """
+    res = _probe_cache_get(url)
+    if res is not None:
+        return res
+    res = await check_ts(url, per_check_timeout=per_check_timeout)
+    ttl = PROBE_TTL_ERROR if res[0] == 'error' else PROBE_TTL_OK
+    if max_ttl is not None:
+        ttl = min(ttl, max_ttl)
+    _probe_cache[url] = (time.monotonic() + ttl, res)
+    _probe_cache.move_to_end(url)
+    if len(_probe_cache) > PROBE_CACHE_SIZE:
+        _probe_cache.popitem(last=False)
+    return res
+
+
+class RateLimiter:
+    """Async context manager allowing at most `rate` entries per `per` seconds.
+
+    Sliding window over the timestamps of recent entries; unlike a semaphore
+    it bounds the request rate, which is what IPTV providers throttle on.
+    """
+    def __init__(self, rate, per=1.0):
+        if rate < 1:
+            raise ValueError(f"rate must be at least 1, got {rate}")
+        self.rate = rate
+        self.per = per
+        self._stamps = deque()
+
+    async def __aenter__(self):
+        while True:
+            now = time.monotonic()
+            while self._stamps and now - self._stamps[0] >= self.per:
+                self._stamps.popleft()
+            if len(self._stamps) < self.rate:
+                self._stamps.append(now)
+                return self
+            await asyncio.sleep(self.per - (now - self._stamps[0]))
+
+    async def __aexit__(self, *exc):
+        return False
 
 
-async def run_checks_concurrent(channels, concurrency=6, per_check_timeout=30):
-    """Run checks concurrently with a semaphore limit. channels is iterable of (id,name,url)."""
-    sem = asyncio.Semaphore(concurrency)
-    results = []
+async def run_checks_concurrent(channels, concurrency=6, per_check_timeout=30, rate_per_host=10, rate=50):
+    """Run checks with `concurrency` workers. channels is iterable of (id,name,url).
+
+    Checks start at most `rate` times per second overall and rate_per_host
+    times per second against the same host. Results are returned in the
+    order of channels.
+    """
+    if rate_per_host < 1:
+        raise ValueError(f"rate_per_host must be at least 1, got {rate_per_host}")
+    global_limit = RateLimiter(rate)
+    host_limits = {}
+    # results are queued and written in batches by one flusher task
+    pending = asyncio.Queue()
+
+    async def _write_batch(batch):
+        # a failed write (e.g. "database is locked") costs this batch only;
+        # the flusher keeps draining and the checks' results are still returned
+        for attempt in range(2):
+            try:
+                await insert_results_bulk(batch)
+                return
+            except Exception as e:
+                last_exc = e
+                if attempt == 0:
+                    await asyncio.sleep(_retry_delay(attempt))
+        print(f"[WARN] dropped {len(batch)} check results, db write failed: {last_exc}")
+
+    async def _flusher():
+        batch = []
+        deadline = None  # when the oldest buffered row is due, even while rows keep arriving
+        while True:
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+            try:
+                row = await asyncio.wait_for(pending.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                row = False
+            if row:
+                if not batch:
+                    deadline = time.monotonic() + RESULT_FLUSH_MAX_AGE
+                batch.append(row)
+                if len(batch) < RESULT_FLUSH_BATCH and time.monotonic() < deadline:
+                    continue
+            if batch:
+                await _write_batch(batch)
+                batch = []
+                deadline = None
+            if row is None:
+                return
 
     async def _run_channel(c):
         cid, name, url = c
-        async with sem:
-            r, notes, throughput, startup = await check_hls(url, per_check_timeout=per_check_timeout)
-            # store result
-            await insert_result(cid, r, notes, throughput, startup)
-            return {'id': cid, 'name': name, 'url': url, 'result': r, 'notes': notes, 'throughput': throughput, 'startup': startup}
-
-    tasks = [asyncio.create_task(_run_channel(c)) for c in channels]
-    for t in asyncio.as_completed(tasks):
-        try:
-            res = await t
-            results.append(res)
-        except Exception as e:
-            # capture failures
-            results.append({'id': None, 'name': None, 'url': None, 'result': 'error', 'notes': str(e), 'throughput': None, 'startup': None})
+        host = urlparse(url).netloc
+        limiter = host_limits.get(host)
+        if limiter is None:
+            limiter = host_limits[host] = RateLimiter(rate_per_host)
+        res = _probe_cache_get(url)
+        if res is None:
+            # only real probes take a rate-limit slot and get stored
+            # per-host first, so waiting on a busy host doesn't hold a global slot
+            async with limiter, global_limit:
+                res = await check_ts_cached(url, per_check_timeout=per_check_timeout)
+            pending.put_nowait((cid, *res))
+        r, notes, throughput, startup = res
+        return {'id': cid, 'name': name, 'url': url, 'result': r, 'notes': notes, 'throughput': throughput, 'startup': startup}
+
+    channels = list(channels)
+    results = [None] * len(channels)
+    # shared by the workers, so only `concurrency` checks exist at any time
+    todo = iter(enumerate(channels))
+
+    async def _worker():
+        for i, c in todo:
+            try:
+                results[i] = await _run_channel(c)
+            except Exception as e:
+                # capture failures, keeping the channel they belong to
+                results[i] = {'id': c[0], 'name': c[1], 'url': c[2], 'result': 'error', 'notes': str(e), 'throughput': None, 'startup': None}
+
+    flusher = asyncio.create_task(_flusher())
+    try:
+        await asyncio.gather(*[_worker() for _ in range(min(concurrency, len(channels)))])
+    finally:
+        pending.put_nowait(None)
+        await flusher
     return results
 
 class Monitor:
@@ -152,21 +435,39 @@ class Monitor:
         self.db = db
         self.interval = interval
         self._task = None
-        self._running = False
+        # set by stop(); also ends the wait between passes early
+        self._stop = asyncio.Event()
+        # channel list and the db channels_version it was read at
+        self._channels = None
+        self._channels_version = None
 
     async def _run_one(self, channel):
         cid, name, url = channel
-        result, notes, throughput, startup = await check_ts(url)
+        if _probe_cache_get(url) is not None:
+            return  # probed recently; that result is already stored
+        result, notes, throughput, startup = await check_ts_cached(url, max_ttl=self.interval / 2)
         await insert_result(cid, result, notes, throughput, startup)
 
+    async def _channels_cached(self):
+        """Return the channel list, re-reading it only after channels were added."""
+        from .db import list_channels, channels_version
+        version = channels_version()
+        if self._channels is None or version != self._channels_version:
+            self._channels = await list_channels()
+            self._channels_version = version
+        return self._channels
+
     async def _loop(self):
-        from .db import list_channels
-        while self._running:
-            channels = await list_channels()
+        while not self._stop.is_set():
+            channels = await self._channels_cached()
             tasks = [self._run_one(c) for c in channels]
             if tasks:
-                await asyncio.gather(*tasks)
-            await asyncio.sleep(self.interval)
+                # shielded so a stop() mid-pass still lets started checks record their results
+                await asyncio.shield(asyncio.gather(*tasks))
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
 
     async def run_once(self):
         """Run a single pass over all channels and return a list of results."""
@@ -175,18 +476,26 @@ class Monitor:
         results = []
         for c in channels:
             cid, name, url = c
-            result, notes, throughput, startup = await check_ts(url)
-            await insert_result(cid, result, notes, throughput, startup)
+            cached = _probe_cache_get(url)
+            if cached is not None:
+                result, notes, throughput, startup = cached
+            else:
+                result, notes, throughput, startup = await check_ts_cached(url, max_ttl=self.interval / 2)
+                await insert_result(cid, result, notes, throughput, startup)
             results.append({'id': cid, 'name': name, 'url': url, 'result': result, 'notes': notes, 'throughput': throughput, 'startup': startup})
         return results
 
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
     def start(self):
-        if self._task and not self._task.done():
+        if self.running:
             return
-        self._running = True
+        self._stop.clear()
         self._task = asyncio.create_task(self._loop())
 
     def stop(self):
-        self._running = False
+        self._stop.set()
         if self._task:
             self._task.cancel()